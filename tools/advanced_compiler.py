@@ -5,14 +5,89 @@ Includes optimizations: constant folding, dead code elimination, register alloca
 """
 
 import sys
+import os
 import re
+import pickle
+import hashlib
 from typing import Dict, List, Tuple, Set, Optional
 from collections import defaultdict
 
+from assembler import Op, parse_immediate
+
+# Where the CLI keeps compiled programs, keyed by a hash of source + settings
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'advcompiler')
+
+# Mnemonic and operand tokens (commas and whitespace are separators)
+_TOKEN_RE = re.compile(r'[^,\s]+')
+
+# Decimal integer literal, as accepted by int()
+_INT_RE = re.compile(r'[+-]?\d+')
+
+# Physical registers R0-R7 and virtual registers V0, V1, ... (case-insensitive)
+NUM_REGISTERS = 8
+_PHYS_REG_RE = re.compile(r'R[0-7]', re.IGNORECASE)
+_VIRT_REG_RE = re.compile(r'V\d+', re.IGNORECASE)
+
+# Op id for 'LABEL' and unknown mnemonics: one past the last real op, so it
+# sets no bit in any of the masks below
+_NO_OP = len(Op)
+
+def _op_mask(*mnemonics: str) -> int:
+    """Bitmask with bit Op[m] set for each mnemonic"""
+    return sum(1 << Op[m] for m in mnemonics)
+
+# Branches (target label is the last operand) and instructions that end a path
+_BRANCH_MASK = _op_mask('JUMP', 'JZ', 'JNZ')
+_STOP_MASK = _op_mask('HALT', 'RETI')
+
+# Instructions whose first operand is written (all other register operands are read)
+_DEF_MASK = _op_mask(
+    'LOADI', 'ADD', 'SUB', 'AND', 'OR', 'XOR', 'LOAD', 'SHL', 'SHR',
+    'MOV', 'NOT', 'POP', 'MUL', 'DIV', 'IN',
+)
+
+def _iter_bits(mask: int):
+    """Yield the indices of the set bits in mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class Insn:
+    """A single parsed instruction (or a 'LABEL' pseudo-instruction)
+    
+    op_id is the Op for op, kept in step with it, so passes can test
+    instruction classes with integer masks instead of string compares.
+    """
+    __slots__ = ('_op', 'op_id', 'args', 'label')
+    
+    def __init__(self, op: str, args: List[str], label: Optional[str] = None):
+        self.op = op
+        self.args = args
+        self.label = label
+    
+    @property
+    def op(self) -> str:
+        return self._op
+    
+    @op.setter
+    def op(self, op: str):
+        self._op = op
+        self.op_id = Op.__members__.get(op, _NO_OP)
+    
+    def __repr__(self):
+        return f"Insn({self.op!r}, {self.args!r}, {self.label!r})"
+
 class AdvancedCompiler:
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
         self.instructions = []
         self.symbols = {}
+        # Register spills go to data memory, counting down from spill_base or
+        # from just below the lowest address the program loads or stores
+        self.spill_base = 63
+        self.spill_top = self.spill_base
+        self.spill_slots = 0
         self.optimizations_enabled = {
             'constant_folding': True,
             'dead_code_elimination': True,
@@ -21,108 +96,307 @@ class AdvancedCompiler:
             'loop_unrolling': False,
         }
     
-    def parse(self, source: str) -> List[Tuple[str, List[str], Optional[str]]]:
-        """Parse source code into instructions"""
+    def parse(self, source: str) -> List[Insn]:
+        """Parse source code into instructions and collect label addresses"""
         lines = source.split('\n')
         instructions = []
+        address = 0
+        self.symbols = {}
         
         for line in lines:
-            line = line.split(';')[0].strip()
-            if not line:
-                continue
+            line = line.partition(';')[0]
             
             # Label
-            if ':' in line:
-                parts = line.split(':', 1)
-                label = parts[0].strip()
-                line = parts[1].strip()
-                if not line:
-                    instructions.append(('LABEL', [], label))
-                    continue
+            label = None
+            head, sep, rest = line.partition(':')
+            if sep:
+                label = head.strip()
+                line = rest
             
             # Instruction
-            parts = re.split(r'[,\s]+', line)
-            mnemonic = parts[0].upper()
-            operands = [p.strip() for p in parts[1:] if p.strip()]
-            instructions.append((mnemonic, operands, None))
+            tokens = _TOKEN_RE.findall(line)
+            if sep:
+                self.symbols[label] = address
+            if not tokens:
+                if sep:
+                    instructions.append(Insn('LABEL', [], label))
+                continue
+            
+            instructions.append(Insn(tokens[0].upper(), tokens[1:], label))
+            address += 1
         
         return instructions
     
-    def constant_folding(self, instructions: List) -> List:
-        """Optimize: Constant folding"""
-        optimized = []
-        i = 0
-        
-        while i < len(instructions):
-            mnemonic, operands, label = instructions[i]
-            
+    def constant_folding(self, instructions: List[Insn]) -> List[Insn]:
+        """Optimize: Constant folding (in place)"""
+        is_int = _INT_RE.fullmatch
+        for insn in instructions:
             # Constant folding: ADD R1, 5, 10 -> LOADI R1, 15
-            if mnemonic == 'ADD' and len(operands) == 3:
-                try:
-                    op1 = int(operands[1])
-                    op2 = int(operands[2])
-                    result = op1 + op2
-                    if 0 <= result <= 63:
-                        optimized.append(('LOADI', [operands[0], str(result)], None))
-                        i += 1
-                        continue
-                except ValueError:
-                    pass
-            
-            optimized.append((mnemonic, operands, label))
-            i += 1
+            if insn.op_id != Op.ADD or len(insn.args) != 3:
+                continue
+            rd, a, b = insn.args
+            if is_int(a) and is_int(b):
+                result = int(a) + int(b)
+                if 0 <= result <= 63:
+                    insn.op = 'LOADI'
+                    insn.args = [rd, str(result)]
         
-        return optimized
+        return instructions
     
-    def dead_code_elimination(self, instructions: List) -> List:
-        """Optimize: Dead code elimination"""
-        # Find all labels that are referenced
-        referenced_labels = set()
-        for mnemonic, operands, label in instructions:
-            if mnemonic in ['JUMP', 'JZ', 'JNZ'] and operands:
-                if operands[0] in self.symbols:
-                    referenced_labels.add(operands[0])
-        
-        # Remove unreferenced labels
-        optimized = []
-        for mnemonic, operands, label in instructions:
-            if mnemonic == 'LABEL':
-                if label in referenced_labels or label == 'START':
-                    optimized.append((mnemonic, operands, label))
+    def dead_code_elimination(self, instructions: List[Insn]) -> List[Insn]:
+        """Optimize: Dead code elimination (in place)"""
+        # Dense id per label so the referenced set is a single int bitmask
+        label_ids = {}
+        for insn in instructions:
+            if insn.label is not None:
+                label_ids.setdefault(insn.label, len(label_ids))
+        
+        # Find all labels that are referenced (the target is the last operand)
+        referenced_labels = 1 << label_ids['START'] if 'START' in label_ids else 0
+        for insn in instructions:
+            if _BRANCH_MASK >> insn.op_id & 1 and insn.args:
+                label_id = label_ids.get(insn.args[-1])
+                if label_id is not None:
+                    referenced_labels |= 1 << label_id
+        
+        # Remove unreferenced labels (and their symbols)
+        kept = []
+        for insn in instructions:
+            if insn.op == 'LABEL' and not referenced_labels >> label_ids[insn.label] & 1:
+                self.symbols.pop(insn.label, None)
             else:
-                optimized.append((mnemonic, operands, label))
+                kept.append(insn)
+        instructions[:] = kept
         
-        return optimized
+        return instructions
     
-    def register_allocation(self, instructions: List) -> List:
-        """Optimize: Register allocation (simplified - would use graph coloring)"""
-        # Simple register allocation: reuse registers when possible
-        # Full implementation would use graph coloring algorithm
-        optimized = instructions  # Placeholder
-        return optimized
+    def _defs_uses(self, insn: Insn) -> Tuple[Set[str], Set[str]]:
+        """Registers written and read by an instruction (upper-cased names)"""
+        regs = [a.upper() for a in insn.args
+                if _PHYS_REG_RE.fullmatch(a) or _VIRT_REG_RE.fullmatch(a)]
+        if _DEF_MASK >> insn.op_id & 1 and insn.args and insn.args[0].upper() in regs:
+            return {insn.args[0].upper()}, set(regs[1:])
+        return set(), set(regs)
     
-    def instruction_scheduling(self, instructions: List) -> List:
-        """Optimize: Instruction scheduling (reorder for better pipeline utilization)"""
-        # Reorder independent instructions to avoid pipeline stalls
-        optimized = []
-        i = 0
+    def _successors(self, instructions: List[Insn]) -> List[Optional[List[int]]]:
+        """Control-flow successors of each instruction (None = unknown jump target)"""
+        targets = {}
+        for i, insn in enumerate(instructions):
+            if insn.label:
+                targets[insn.label] = i
+        
+        succ = []
+        for i, insn in enumerate(instructions):
+            fall = [i + 1] if i + 1 < len(instructions) else []
+            if _STOP_MASK >> insn.op_id & 1:
+                succ.append([])
+            elif _BRANCH_MASK >> insn.op_id & 1 and insn.args:
+                target = targets.get(insn.args[-1])
+                if target is None:
+                    succ.append(None)
+                elif insn.op_id == Op.JUMP:
+                    succ.append([target])
+                else:
+                    succ.append(fall + [target])
+            else:
+                succ.append(fall)
+        return succ
+    
+    def liveness(self, instructions: List[Insn]) -> Tuple[List[str], List[int]]:
+        """Backward dataflow: registers live after each instruction
+        
+        Returns the register names and, per instruction, a live-out bitmask
+        in which bit i stands for names[i].
+        """
+        defs_uses = [self._defs_uses(insn) for insn in instructions]
+        names = sorted(set().union(*(d | u for d, u in defs_uses)))
+        bit = {name: 1 << i for i, name in enumerate(names)}
+        masks = [(sum(bit[r] for r in d), sum(bit[r] for r in u)) for d, u in defs_uses]
+        succ = self._successors(instructions)
+        every_reg = (1 << len(names)) - 1
         
-        while i < len(instructions):
-            mnemonic, operands, label = instructions[i]
-            optimized.append((mnemonic, operands, label))
+        live_in = [0] * len(instructions)
+        live_out = [0] * len(instructions)
+        changed = True
+        while changed:
+            changed = False
+            for i in range(len(instructions) - 1, -1, -1):
+                if succ[i] is None:
+                    # Jump to a raw address: assume everything stays live
+                    out = every_reg
+                else:
+                    out = 0
+                    for s in succ[i]:
+                        out |= live_in[s]
+                defs, uses = masks[i]
+                new_in = uses | (out & ~defs)
+                if out != live_out[i] or new_in != live_in[i]:
+                    live_out[i], live_in[i] = out, new_in
+                    changed = True
+        
+        return names, live_out
+    
+    def interference_graph(self, instructions: List[Insn]) -> Tuple[List[str], List[int]]:
+        """Build the register interference graph from liveness
+        
+        Returns the register names and one adjacency bitmask row per register.
+        """
+        names, live_out = self.liveness(instructions)
+        index = {name: i for i, name in enumerate(names)}
+        bit = {name: 1 << i for i, name in enumerate(names)}
+        adj = [0] * len(names)
+        
+        for insn, out in zip(instructions, live_out):
+            for d in self._defs_uses(insn)[0]:
+                adj[index[d]] |= out & ~bit[d]
+        
+        # Registers read before any write are live together on entry
+        if instructions:
+            defs, uses = self._defs_uses(instructions[0])
+            entry = sum(bit[r] for r in uses) | (live_out[0] & ~sum(bit[r] for r in defs))
+            for i in _iter_bits(entry):
+                adj[i] |= entry & ~(1 << i)
+        
+        # Make the matrix symmetric
+        for i in range(len(names)):
+            for j in _iter_bits(adj[i]):
+                adj[j] |= 1 << i
+        
+        return names, adj
+    
+    def _color(self, names: List[str], adj: List[int]) -> Tuple[Dict[str, int], List[str]]:
+        """Welsh-Powell coloring of virtual registers; physical ones are precolored"""
+        colors = [-1] * len(names)
+        colored = 0
+        for i, name in enumerate(names):
+            if _PHYS_REG_RE.fullmatch(name):
+                colors[i] = int(name[1:])
+                colored |= 1 << i
+        virtual = [i for i in range(len(names)) if colors[i] < 0]
+        virtual.sort(key=lambda i: bin(adj[i]).count('1'), reverse=True)
+        
+        spilled = []
+        for i in virtual:
+            used = 0
+            for j in _iter_bits(adj[i] & colored):
+                used |= 1 << colors[j]
+            color = (~used & (used + 1)).bit_length() - 1  # lowest free color
+            if color < NUM_REGISTERS:
+                colors[i] = color
+                colored |= 1 << i
+            else:
+                spilled.append(names[i])
+        return {name: colors[i] for i, name in enumerate(names) if colors[i] >= 0}, spilled
+    
+    def _spill(self, instructions: List[Insn], reg: str, temps: Set[str],
+               first_temp: int) -> List[Insn]:
+        """Keep a virtual register in memory, reloading it around each access"""
+        address = self.spill_top - self.spill_slots
+        if address < 0:
+            raise ValueError(f"No free data memory to spill {reg}")
+        slot = f"[{address}]"
+        self.spill_slots += 1
+        
+        rewritten = []
+        for insn in instructions:
+            defs, uses = self._defs_uses(insn)
+            if reg not in defs and reg not in uses:
+                rewritten.append(insn)
+                continue
             
-            # Look ahead for independent instructions
-            if i + 1 < len(instructions):
-                next_mnemonic, next_operands, next_label = instructions[i + 1]
-                # If next instruction doesn't depend on current, can potentially reorder
-                # (Simplified - full implementation would check dependencies)
-                pass
+            temp = f"V{first_temp + len(temps)}"
+            temps.add(temp)
+            insn.args = [temp if a.upper() == reg else a for a in insn.args]
+            if reg in uses:
+                # The reload becomes the jump target in place of the instruction
+                rewritten.append(Insn('LOAD', [temp, slot], insn.label))
+                insn.label = None
+            rewritten.append(insn)
+            if reg in defs:
+                rewritten.append(Insn('STORE', [temp, slot]))
+        return rewritten
+    
+    def _memory_addresses(self, instructions: List[Insn]) -> Set[int]:
+        """Literal data memory addresses the program loads from or stores to"""
+        addresses = set()
+        for insn in instructions:
+            if insn.op_id in (Op.LOAD, Op.STORE) and len(insn.args) > 1:
+                try:
+                    addresses.add(parse_immediate(insn.args[1]))
+                except ValueError:
+                    pass  # not a literal; the assembler reports it
+        return addresses
+    
+    def register_allocation(self, instructions: List[Insn]) -> List[Insn]:
+        """Optimize: Register allocation (graph coloring of virtual registers)"""
+        self.spill_slots = 0
+        self.spill_top = min([self.spill_base] +
+                             [a - 1 for a in self._memory_addresses(instructions)])
+        temps = set()
+        first_temp = 1 + max((int(a[1:]) for insn in instructions for a in insn.args
+                              if _VIRT_REG_RE.fullmatch(a)), default=-1)
+        
+        # A jump to a raw address pins every instruction where it is, so
+        # nothing may be inserted or removed
+        fixed_addresses = any(s is None for s in self._successors(instructions))
+        
+        while True:
+            names, adj = self.interference_graph(instructions)
+            colors, spilled = self._color(names, adj)
+            if not spilled:
+                break
+            if fixed_addresses:
+                raise ValueError(f"Cannot spill {spilled[0]}: program jumps to a raw address")
             
-            i += 1
+            to_spill = set()
+            for reg in spilled:
+                if reg in temps:
+                    # Reload temps are as short as ranges get: spill the
+                    # busiest longer-lived neighbour instead
+                    candidates = [j for j in _iter_bits(adj[names.index(reg)])
+                                  if _VIRT_REG_RE.fullmatch(names[j]) and names[j] not in temps]
+                    if not candidates:
+                        raise ValueError(f"Register pressure too high to allocate {reg}")
+                    reg = names[max(candidates, key=lambda j: bin(adj[j]).count('1'))]
+                to_spill.add(reg)
+            for reg in sorted(to_spill):
+                instructions[:] = self._spill(instructions, reg, temps, first_temp)
         
-        return optimized
+        # Rewrite virtual registers and drop moves that coloring turned into
+        # no-ops (user-written MOV Rx, Rx is padding and stays). Spills and
+        # dropped moves shift addresses, so re-record symbols on the way.
+        kept = []
+        address = 0
+        self.symbols = {}
+        for insn in instructions:
+            had_virtual = False
+            args = []
+            for a in insn.args:
+                if _VIRT_REG_RE.fullmatch(a):
+                    had_virtual = True
+                    a = f"R{colors[a.upper()]}"
+                args.append(a)
+            insn.args = args
+            if (had_virtual and not fixed_addresses and insn.op_id == Op.MOV
+                    and len(args) == 2 and args[0].upper() == args[1].upper()
+                    and not insn.label):
+                continue
+            kept.append(insn)
+            if insn.label:
+                self.symbols[insn.label] = address
+            if insn.op != 'LABEL':
+                address += 1
+        instructions[:] = kept
+        
+        return instructions
+    
+    def instruction_scheduling(self, instructions: List[Insn]) -> List[Insn]:
+        """Optimize: Instruction scheduling (reorder for better pipeline utilization)"""
+        # Reordering independent instructions to avoid pipeline stalls is
+        # not implemented yet (it would need a dependency check)
+        return instructions
     
-    def optimize(self, instructions: List) -> List:
+    def optimize(self, instructions: List[Insn]) -> List[Insn]:
         """Apply all enabled optimizations"""
         optimized = instructions
         
@@ -140,30 +414,43 @@ class AdvancedCompiler:
         
         return optimized
     
-    def compile(self, source: str) -> List[Tuple[int, int]]:
-        """Compile source code with optimizations"""
-        # Parse
-        instructions = self.parse(source)
+    def _cache_path(self, source: str) -> str:
+        """Cache file for this source under the current settings and compiler"""
+        key = hashlib.blake2b(digest_size=16)
+        key.update(source.encode())
+        key.update(repr((sorted(self.optimizations_enabled.items()), self.spill_base,
+                         os.path.getmtime(__file__),
+                         os.path.getmtime(sys.modules[Op.__module__].__file__))).encode())
+        return os.path.join(self.cache_dir, key.hexdigest() + '.pkl')
+    
+    def compile(self, source: str) -> List[Insn]:
+        """Compile source code with optimizations, reusing a cached result if any"""
+        if self.cache_dir is None:
+            return self._compile(source)
         
-        # Collect labels
-        address = 0
-        for mnemonic, operands, label in instructions:
-            if label:
-                self.symbols[label] = address
-            if mnemonic != 'LABEL':
-                address += 1
+        path = self._cache_path(source)
+        try:
+            with open(path, 'rb') as f:
+                instructions, self.symbols = pickle.load(f)
+            return instructions
+        except Exception:
+            pass  # missing, stale or unreadable: compile from scratch
         
-        # Optimize
-        instructions = self.optimize(instructions)
+        instructions = self._compile(source)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path, 'wb') as f:
+                pickle.dump((instructions, self.symbols), f, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass  # caching is best-effort
+        return instructions
+    
+    def _compile(self, source: str) -> List[Insn]:
+        # Parse (also collects labels)
+        instructions = self.parse(source)
         
-        # Re-collect labels after optimization
-        self.symbols = {}
-        address = 0
-        for mnemonic, operands, label in instructions:
-            if label:
-                self.symbols[label] = address
-            if mnemonic != 'LABEL':
-                address += 1
+        # Optimize (passes that move or remove instructions keep symbols current)
+        instructions = self.optimize(instructions)
         
         # Encode (would use assembler)
         # For now, return optimized instructions
@@ -181,24 +468,24 @@ def main():
         with open(input_file, 'r') as f:
             source = f.read()
         
-        compiler = AdvancedCompiler()
+        compiler = AdvancedCompiler(cache_dir=DEFAULT_CACHE_DIR)
         optimized = compiler.compile(source)
         
         if output_file:
             with open(output_file, 'w') as f:
-                for mnemonic, operands, label in optimized:
-                    if label:
-                        f.write(f"{label}:\n")
-                    if mnemonic != 'LABEL':
-                        f.write(f"    {mnemonic} {', '.join(operands)}\n")
+                for insn in optimized:
+                    if insn.label:
+                        f.write(f"{insn.label}:\n")
+                    if insn.op != 'LABEL':
+                        f.write(f"    {insn.op} {', '.join(insn.args)}\n")
             print(f"Compiled and optimized to {output_file}")
         else:
             print("Optimized instructions:")
-            for mnemonic, operands, label in optimized:
-                if label:
-                    print(f"{label}:")
-                if mnemonic != 'LABEL':
-                    print(f"  {mnemonic} {', '.join(operands)}")
+            for insn in optimized:
+                if insn.label:
+                    print(f"{insn.label}:")
+                if insn.op != 'LABEL':
+                    print(f"  {insn.op} {', '.join(insn.args)}")
     
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -6,7 +6,10 @@ Converts assembly mnemonics to binary instruction format
 
 import sys
 import re
-from typing import Dict, List, Tuple, Optional
+import functools
+from array import array
+from enum import IntEnum
+from typing import Callable, Dict, Iterator, List, Tuple, Optional, TextIO, Union
 
 # Instruction opcodes
 OPCODES = {
@@ -36,12 +39,116 @@ OPCODES = {
     'RETI': 0xF,
 }
 
+# Dense mnemonic ids, one per OPCODES entry (several mnemonics share a
+# hardware opcode, so these are not the opcode values themselves)
+Op = IntEnum('Op', list(OPCODES), start=0)
+
 # Register names
 REGISTERS = {
     'R0': 0, 'R1': 1, 'R2': 2, 'R3': 3,
     'R4': 4, 'R5': 5, 'R6': 6, 'R7': 7,
 }
 
+# Instruction format: {opcode[3:0], reg1[2:0], reg2[2:0], immediate[5:0]}
+# Each encoder is (opcode, fixed bits, operand layout); every operand is
+# a (kind, field) pair where field 0/1/2 is reg1/reg2/immediate and None
+# means the operand is parsed but not encoded.
+_ENCODERS = {
+    # LOADI Rd, imm
+    'LOADI': (0x0, 0, (('reg', 0), ('imm', 2))),
+    # ADD/SUB/MUL Rd, Rs1, Rs2
+    'ADD': (0x1, 0, (('reg', 1), ('reg', 0), ('reg', None))),
+    'SUB': (0x2, 0, (('reg', 1), ('reg', 0), ('reg', None))),
+    'MUL': (0xD, 0, (('reg', 1), ('reg', 0), ('reg', None))),
+    # STORE Rs, [addr] / LOAD Rd, [addr]
+    'STORE': (0x6, 0, (('reg', 0), ('addr', 2))),
+    'LOAD': (0x7, 0, (('reg', 0), ('addr', 2))),
+    # JUMP addr / JZ Rs, addr / JNZ Rs, addr
+    'JUMP': (0xC, 0, (('target', 2),)),
+    'JZ': (0xD, 0, (('reg', 0), ('target', 2))),
+    'JNZ': (0xE, 0, (('reg', 0), ('target', 2))),
+    # PUSH Rs (reg2=000) / POP Rd (reg2=001)
+    'PUSH': (0xE, 0 << 6, (('reg', 0),)),
+    'POP': (0xE, 1 << 6, (('reg', 0),)),
+    # HALT (all zeros) / RETI (imm=1)
+    'HALT': (0xF, 0, ()),
+    'RETI': (0xF, 1, ()),
+}
+
+# Error message prefix for each kind of 6-bit operand
+_RANGE_NAMES = {
+    'imm': 'Immediate value',
+    'addr': 'Address',
+    'target': 'Jump address',
+}
+
+def _u6(value: int, kind: str = 'imm') -> int:
+    """Check that a value fits the 6-bit field (0-63; the CPU zero-extends it)"""
+    if value & ~0x3F:
+        raise ValueError(f"{_RANGE_NAMES[kind]} {value} exceeds 6-bit range (0-63)")
+    return value
+
+# Bit offsets of the reg1/reg2/immediate fields
+_FIELD_SHIFTS = (9, 6, 0)
+
+def _specialize(mnemonic: str, opcode: int, fixed: int, layout) -> Callable:
+    """Generate a straight-line encoder for one mnemonic from its table entry"""
+    lines = [f"def enc_{mnemonic}(self, ops):"]
+    terms = [f"0x{(opcode << 12) | fixed:04X}"]
+    for i, (kind, field) in enumerate(layout):
+        # Operands are parsed left to right so errors name the first bad one
+        lines.append(f"    a{i} = self.parse_operand(ops[{i}], {kind!r})")
+        if field is not None:
+            terms.append(f"(a{i} << {_FIELD_SHIFTS[field]})")
+    lines.append("    return " + " | ".join(terms))
+    
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return namespace[f"enc_{mnemonic}"]
+
+# Generated encoders indexed by Op: enc(assembler, operands) -> 16-bit word,
+# with the operand count each one needs (None = encoding not implemented)
+_SPECIALIZED: List[Optional[Callable]] = [None] * len(Op)
+_OPERAND_COUNTS = [0] * len(Op)
+for _m, _spec in _ENCODERS.items():
+    _SPECIALIZED[Op[_m]] = _specialize(_m, *_spec)
+    _OPERAND_COUNTS[Op[_m]] = len(_spec[2])
+del _m, _spec
+
+@functools.lru_cache(maxsize=None)
+def _parse_register(reg_str: str) -> int:
+    reg_str = reg_str.strip().upper()
+    if reg_str in REGISTERS:
+        return REGISTERS[reg_str]
+    raise ValueError(f"Invalid register: {reg_str}")
+
+# Number base by literal prefix (anything else is decimal)
+_BASES = {'0x': 16, '0X': 16, '0b': 2, '0B': 2}
+
+@functools.lru_cache(maxsize=256)
+def parse_immediate(imm_str: str) -> int:
+    """Parse an immediate or [address] literal (hex, binary or decimal)"""
+    imm_str = imm_str.strip()
+    
+    # Remove brackets if present (for memory addresses)
+    if imm_str[:1] == '[' and imm_str[-1:] == ']':
+        imm_str = imm_str[1:-1]
+    
+    # Hex, binary or decimal, optionally signed
+    digits = imm_str[1:] if imm_str[:1] in ('-', '+') else imm_str
+    return int(imm_str, _BASES.get(digits[:2], 10))
+
+# Mnemonic and operand tokens (commas and whitespace are separators)
+_TOKEN_RE = re.compile(r'[^,\s]+')
+
+# Whole-source scanner: one match per comment, line end, label or token
+_SOURCE_RE = re.compile(r"""
+    (?P<comment>;[^\n]*)
+  | (?P<newline>\n)
+  | (?P<label>[^,\s:;]*)[^\S\n]*:
+  | (?P<token>[^,\s:;]+)
+""", re.VERBOSE)
+
 class Assembler:
     def __init__(self):
         self.labels: Dict[str, int] = {}
@@ -50,216 +157,158 @@ class Assembler:
         
     def parse_register(self, reg_str: str) -> int:
         """Parse register name to number"""
-        reg_str = reg_str.strip().upper()
-        if reg_str in REGISTERS:
-            return REGISTERS[reg_str]
-        raise ValueError(f"Invalid register: {reg_str}")
+        return _parse_register(reg_str)
     
     def parse_immediate(self, imm_str: str) -> int:
         """Parse immediate value (hex, decimal, or binary)"""
-        imm_str = imm_str.strip()
-        
-        # Remove brackets if present (for memory addresses)
-        if imm_str.startswith('[') and imm_str.endswith(']'):
-            imm_str = imm_str[1:-1]
-        
-        # Hex
-        if imm_str.startswith('0x') or imm_str.startswith('0X'):
-            return int(imm_str, 16)
-        # Binary
-        elif imm_str.startswith('0b') or imm_str.startswith('0B'):
-            return int(imm_str, 2)
-        # Decimal
-        else:
-            return int(imm_str)
+        return parse_immediate(imm_str)
+    
+    def parse_operand(self, operand: Union[str, int], kind: str) -> int:
+        """Parse a register or 6-bit immediate operand (ints are resolved labels)"""
+        if isinstance(operand, int):
+            if kind == 'reg':
+                raise ValueError(f"Invalid register: {operand}")
+            return _u6(operand, kind)
+        if kind == 'reg':
+            return self.parse_register(operand)
+        return _u6(self.parse_immediate(operand), kind)
     
-    def encode_instruction(self, mnemonic: str, operands: List[str]) -> int:
+    def encode_instruction(self, mnemonic: Union[str, Op], operands: List[Union[str, int]]) -> int:
         """Encode instruction to 16-bit binary format"""
-        mnemonic = mnemonic.upper()
-        opcode = OPCODES.get(mnemonic)
-        
-        if opcode is None:
-            raise ValueError(f"Unknown instruction: {mnemonic}")
-        
-        # Instruction format: {opcode[3:0], reg1[2:0], reg2[2:0], immediate[5:0]}
-        
-        if mnemonic == 'LOADI':
-            # LOADI Rd, imm
-            rd = self.parse_register(operands[0])
-            imm = self.parse_immediate(operands[1])
-            if imm > 63:
-                raise ValueError(f"Immediate value {imm} exceeds 6-bit range (0-63)")
-            return (opcode << 12) | (rd << 9) | (0 << 6) | imm
-        
-        elif mnemonic == 'ADD':
-            # ADD Rd, Rs1, Rs2
-            rd = self.parse_register(operands[0])
-            rs1 = self.parse_register(operands[1])
-            rs2 = self.parse_register(operands[2])
-            return (opcode << 12) | (rs1 << 9) | (rd << 6) | 0
-        
-        elif mnemonic == 'SUB':
-            # SUB Rd, Rs1, Rs2
-            rd = self.parse_register(operands[0])
-            rs1 = self.parse_register(operands[1])
-            rs2 = self.parse_register(operands[2])
-            return (opcode << 12) | (rs1 << 9) | (rd << 6) | 0
-        
-        elif mnemonic == 'STORE':
-            # STORE Rs, [addr]
-            rs = self.parse_register(operands[0])
-            addr = self.parse_immediate(operands[1])
-            if addr > 63:
-                raise ValueError(f"Address {addr} exceeds 6-bit range (0-63)")
-            return (opcode << 12) | (rs << 9) | (0 << 6) | addr
-        
-        elif mnemonic == 'LOAD':
-            # LOAD Rd, [addr]
-            rd = self.parse_register(operands[0])
-            addr = self.parse_immediate(operands[1])
-            if addr > 63:
-                raise ValueError(f"Address {addr} exceeds 6-bit range (0-63)")
-            return (opcode << 12) | (rd << 9) | (0 << 6) | addr
-        
-        elif mnemonic == 'JUMP':
-            # JUMP addr
-            addr = self.parse_immediate(operands[0])
-            if addr > 63:
-                raise ValueError(f"Jump address {addr} exceeds 6-bit range (0-63)")
-            return (opcode << 12) | (0 << 9) | (0 << 6) | addr
-        
-        elif mnemonic == 'JZ':
-            # JZ Rs, addr
-            rs = self.parse_register(operands[0])
-            addr = self.parse_immediate(operands[1])
-            if addr > 63:
-                raise ValueError(f"Jump address {addr} exceeds 6-bit range (0-63)")
-            return (opcode << 12) | (rs << 9) | (0 << 6) | addr
-        
-        elif mnemonic == 'JNZ':
-            # JNZ Rs, addr
-            rs = self.parse_register(operands[0])
-            addr = self.parse_immediate(operands[1])
-            if addr > 63:
-                raise ValueError(f"Jump address {addr} exceeds 6-bit range (0-63)")
-            return (opcode << 12) | (rs << 9) | (0 << 6) | addr
-        
-        elif mnemonic == 'PUSH':
-            # PUSH Rs (opcode=1110, reg2=000)
-            rs = self.parse_register(operands[0])
-            return (0xE << 12) | (rs << 9) | (0 << 6) | 0
-        
-        elif mnemonic == 'POP':
-            # POP Rd (opcode=1110, reg2=001)
-            rd = self.parse_register(operands[0])
-            return (0xE << 12) | (rd << 9) | (1 << 6) | 0
-        
-        elif mnemonic == 'MUL':
-            # MUL Rd, Rs1, Rs2 (opcode=1101, reg2=000)
-            rd = self.parse_register(operands[0])
-            rs1 = self.parse_register(operands[1])
-            rs2 = self.parse_register(operands[2])
-            return (0xD << 12) | (rs1 << 9) | (rd << 6) | 0
+        if isinstance(mnemonic, Op):
+            op = mnemonic
+        else:
+            op = Op.__members__.get(mnemonic.upper())
+            if op is None:
+                raise ValueError(f"Unknown instruction: {mnemonic.upper()}")
         
-        elif mnemonic == 'HALT':
-            # HALT (opcode=1111, all zeros)
-            return 0xF000
+        encoder = _SPECIALIZED[op]
+        if encoder is None:
+            raise ValueError(f"Instruction encoding not implemented: {op.name}")
         
-        elif mnemonic == 'RETI':
-            # RETI (opcode=1111, imm=1)
-            return 0xF001
+        count = _OPERAND_COUNTS[op]
+        if len(operands) < count:
+            raise ValueError(f"{op.name} expects {count} operand(s), got {len(operands)}")
         
-        else:
-            raise ValueError(f"Instruction encoding not implemented: {mnemonic}")
+        return encoder(self, operands)
     
     def assemble_line(self, line: str) -> Optional[Tuple[str, List[str], Optional[int]]]:
         """Parse a single line of assembly"""
         # Remove comments
-        line = line.split(';')[0].strip()
-        if not line:
-            return None
+        line = line.partition(';')[0]
         
         # Check for label
         label = None
-        if ':' in line:
-            parts = line.split(':', 1)
-            label = parts[0].strip()
-            line = parts[1].strip()
-            if not line:
-                return ('LABEL', [label], None)
+        head, sep, rest = line.partition(':')
+        if sep:
+            label = head.strip()
+            line = rest
         
         # Parse instruction
-        parts = re.split(r'[,\s]+', line)
-        mnemonic = parts[0].upper()
-        operands = [p.strip() for p in parts[1:] if p.strip()]
+        tokens = _TOKEN_RE.findall(line)
+        if not tokens:
+            return ('LABEL', [label], None) if sep else None
         
-        return (mnemonic, operands, label)
+        return (tokens[0].upper(), tokens[1:], label)
+    
+    def parse_source(self, source: str) -> Iterator[Tuple[str, List[str], Optional[str]]]:
+        """Parse a whole program in one regex scan, yielding what assemble_line
+        would return for each non-empty line"""
+        label = None
+        tokens = []
+        for m in _SOURCE_RE.finditer(source + '\n'):
+            kind = m.lastgroup
+            if kind == 'token':
+                tokens.append(m.group(kind))
+            elif kind == 'label':
+                label = m.group(kind)
+            elif kind == 'newline':
+                if tokens:
+                    yield (tokens[0].upper(), tokens[1:], label)
+                    tokens = []
+                elif label is not None:
+                    yield ('LABEL', [label], None)
+                label = None
     
     def assemble(self, source: str) -> List[Tuple[int, int]]:
         """Assemble source code to binary instructions"""
-        lines = source.split('\n')
+        parsed = list(self.parse_source(source))
         
-        # First pass: collect labels
-        address = 0
-        for line in lines:
-            parsed = self.assemble_line(line)
-            if parsed is None:
+        # First pass: collect labels and note operands that may name one
+        program = []
+        fixups = []
+        for mnemonic, operands, label in parsed:
+            if mnemonic == 'LABEL':
+                self.labels[operands[0]] = len(program)
                 continue
-            mnemonic, operands, label = parsed
             
             if label:
-                self.labels[label] = address
-            
-            if mnemonic != 'LABEL':
-                address += 1
+                self.labels[label] = len(program)
+            # Any operand not in a register slot may name a label
+            layout = _ENCODERS[mnemonic][2] if mnemonic in _ENCODERS else ()
+            for i, op in enumerate(operands):
+                if i >= len(layout) or layout[i][0] != 'reg':
+                    fixups.append((len(program), i, op))
+            # Resolve the mnemonic to its Op once; unknown ones stay strings
+            # so encoding reports them
+            program.append((Op.__members__.get(mnemonic, mnemonic), operands))
+        
+        # Resolve label references to addresses in place
+        for address, i, name in fixups:
+            if name in self.labels:
+                program[address][1][i] = self.labels[name]
         
         # Second pass: encode instructions
-        address = 0
         instructions = []
-        for line in lines:
-            parsed = self.assemble_line(line)
-            if parsed is None:
-                continue
-            mnemonic, operands, label = parsed
-            
-            if mnemonic == 'LABEL':
-                continue
-            
-            # Replace labels with addresses
-            for i, op in enumerate(operands):
-                if op in self.labels:
-                    operands[i] = str(self.labels[op])
-            
+        for address, (mnemonic, operands) in enumerate(program):
             try:
                 instruction = self.encode_instruction(mnemonic, operands)
                 instructions.append((address, instruction))
-                address += 1
             except Exception as e:
                 raise ValueError(f"Error at address {address}: {e}")
         
         return instructions
     
-    def format_verilog(self, instructions: List[Tuple[int, int]]) -> str:
-        """Format instructions as Verilog initial block"""
-        lines = ["    // Initialize all memory to 0"]
-        lines.append("    for (i = 0; i < 256; i = i + 1) begin")
-        lines.append("        memory[i] = 16'b0000000000000000;")
-        lines.append("    end")
-        lines.append("")
-        lines.append("    // Program instructions")
+    def iter_verilog(self, instructions: List[Tuple[int, int]]) -> Iterator[str]:
+        """Yield the Verilog initial block one line at a time (no newlines)"""
+        yield "    // Initialize all memory to 0"
+        yield "    for (i = 0; i < 256; i = i + 1) begin"
+        yield "        memory[i] = 16'b0000000000000000;"
+        yield "    end"
+        yield ""
+        yield "    // Program instructions"
         
+        fmt = "    memory[{}] = 16'h{:04X};".format
         for addr, inst in instructions:
-            lines.append(f"    memory[{addr}] = 16'h{inst:04X};")
-        
-        return '\n'.join(lines)
+            yield fmt(addr, inst)
+    
+    def format_verilog(self, instructions: List[Tuple[int, int]]) -> str:
+        """Format instructions as Verilog initial block"""
+        return '\n'.join(self.iter_verilog(instructions))
+    
+    def write_verilog(self, instructions: List[Tuple[int, int]], f: TextIO):
+        """Stream the Verilog initial block to a file without building it in memory"""
+        f.writelines(line + '\n' for line in self.iter_verilog(instructions))
+    
+    def format_binary(self, instructions: List[Tuple[int, int]]) -> bytes:
+        """Pack instructions as raw little-endian 16-bit words, one per address"""
+        words = array('H', (inst for _, inst in instructions))
+        if sys.byteorder == 'big':
+            words.byteswap()
+        return words.tobytes()
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: assembler.py <input.asm> [output.v]")
+    args = sys.argv[1:]
+    binary = '--binary' in args
+    if binary:
+        args.remove('--binary')
+    
+    if not args or (binary and len(args) < 2):
+        print("Usage: assembler.py [--binary] <input.asm> [output.v | output.bin]")
         sys.exit(1)
     
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
+    input_file = args[0]
+    output_file = args[1] if len(args) > 1 else None
     
     try:
         with open(input_file, 'r') as f:
@@ -269,10 +318,13 @@ def main():
         instructions = assembler.assemble(source)
         
         # Output
-        if output_file:
-            verilog_code = assembler.format_verilog(instructions)
+        if binary:
+            with open(output_file, 'wb') as f:
+                f.write(assembler.format_binary(instructions))
+            print(f"Assembled {len(instructions)} instructions to {output_file}")
+        elif output_file:
             with open(output_file, 'w') as f:
-                f.write(verilog_code)
+                assembler.write_verilog(instructions, f)
             print(f"Assembled {len(instructions)} instructions to {output_file}")
         else:
             print("Assembled instructions:")
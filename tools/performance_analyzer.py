@@ -6,9 +6,13 @@ Analyzes VCD files and generates performance reports
 
 import sys
 import re
+import mmap
 from collections import defaultdict
 from typing import Dict, List
 
+# Timestamp lines ("#<time>") in the value-change section of a VCD
+_TIME_RE = re.compile(rb'^#(\d+)', re.MULTILINE)
+
 class PerformanceAnalyzer:
     def __init__(self, vcd_file: str):
         self.vcd_file = vcd_file
@@ -18,27 +22,29 @@ class PerformanceAnalyzer:
         
     def parse_vcd(self):
         """Parse VCD file and extract signal data"""
-        with open(self.vcd_file, 'r') as f:
-            current_time = 0
-            in_header = True
+        with open(self.vcd_file, 'rb') as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return  # empty file
             
-            for line in f:
-                line = line.strip()
-                
-                # Parse time changes
-                if line.startswith('#') and not in_header:
-                    current_time = int(line[1:])
-                    self.cycles = max(self.cycles, current_time)
-                
-                # End of header
-                elif line.startswith('$enddefinitions'):
-                    in_header = False
+            with buf:
+                # Only the "#<time>" markers after the header are used so far.
+                # VCD timestamps never decrease, so the last one is the total
+                # and the search can run backwards from the end of the file.
+                header_end = buf.find(b'$enddefinitions')
+                if header_end < 0:
+                    return
                 
-                # Parse signal values (simplified)
-                elif not in_header and line:
-                    # This is a simplified parser - full implementation would
-                    # track signal definitions and parse values properly
-                    pass
+                pos = len(buf)
+                while pos > header_end:
+                    pos = buf.rfind(b'\n#', header_end, pos)
+                    if pos < 0:
+                        break
+                    m = _TIME_RE.match(buf, pos + 1)
+                    if m:
+                        self.cycles = max(self.cycles, int(m.group(1)))
+                        break
     
     def analyze(self) -> Dict:
         """Analyze performance metrics"""
@@ -8,7 +8,8 @@ import subprocess
 import sys
 import os
 import re
-from typing import List, Tuple, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Optional
 
 class TestCase:
     def __init__(self, name: str, description: str):
@@ -40,6 +41,15 @@ class InstructionTest(TestCase):
         # For now, placeholder
         return True
 
+def _run_test(test: TestCase) -> Tuple[str, str]:
+    """Run one test (in a worker process) and return (status, message)"""
+    try:
+        if test.run():
+            return "PASSED", ""
+        return "FAILED", test.error_message
+    except Exception as e:
+        return "ERROR", str(e)
+
 class TestSuite:
     def __init__(self):
         self.tests: List[TestCase] = []
@@ -48,30 +58,38 @@ class TestSuite:
     def add_test(self, test: TestCase):
         self.tests.append(test)
     
-    def run_all(self) -> bool:
-        """Run all tests and return True if all passed"""
+    def run_all(self, jobs: Optional[int] = None) -> bool:
+        """Run all tests in parallel (jobs workers, default one per core)
+        and return True if all passed"""
         print("=" * 60)
         print("Running CPU Test Suite")
         print("=" * 60)
         print()
         
+        # Tests mostly wait on simulator subprocesses, so run them side by side;
+        # map() keeps results in the order the tests were added
+        outcomes = []
+        if self.tests:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                outcomes = list(pool.map(_run_test, self.tests))
+        
         passed = 0
         failed = 0
+        self.results = []
         
-        for test in self.tests:
+        for test, (status, message) in zip(self.tests, outcomes):
             print(f"Running: {test.name}")
             print(f"  Description: {test.description}")
             
-            try:
-                result = test.run()
-                if result:
-                    print(f"  ✓ PASSED")
-                    passed += 1
-                else:
-                    print(f"  ✗ FAILED: {test.error_message}")
-                    failed += 1
-            except Exception as e:
-                print(f"  ✗ ERROR: {e}")
+            test.passed = status == "PASSED"
+            test.error_message = message
+            self.results.append((test.name, test.passed, message))
+            
+            if test.passed:
+                print(f"  ✓ PASSED")
+                passed += 1
+            else:
+                print(f"  ✗ {status}: {message}")
                 failed += 1
             
             print()
@@ -6,215 +6,419 @@ ASCII-style waveforms so you can sanity-check a run from the terminal.
 """
 
 import sys
+import os
 import re
+import mmap
+import pickle
+import heapq
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import groupby
 
-def parse_vcd(vcd_file):
-    """Parse VCD file and extract signal data"""
-    
-    signals = {}  # Maps identifier to signal name
-    values = defaultdict(list)  # Maps signal name to [(time, value)]
-    current_time = 0
+# Scalar value bytes to the str stored for them
+_BIT_VALUES = {b'0': '0', b'1': '1', b'x': 'x', b'z': 'z'}
+
+# Header patterns: $var definitions (width, identifier, name) and the line
+# that ends the header
+_VAR_RE = re.compile(rb'^[ \t]*\$var[ \t]+\S+[ \t]+(\d+)[ \t]+(\S+)[ \t]+(\S+)', re.M)
+_ENDDEFS_RE = re.compile(rb'^[ \t]*\$enddefinitions', re.M)
+
+# Bodies at least this large are parsed in parallel shards
+_PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+
+# Line classifier for the VCD body: time, scalar change or vector change
+# (lastindex 1, 3, 5)
+_CHANGE_RE = re.compile(rb'''^[ \t]*(?:
+      \#(\d+)
+    | ([01xz])(\S+)
+    | b(\S+)[ \t]+(\S+)
+)''', re.M | re.X)
+
+def read_vcd_header(vcd_file):
+    """Read only the VCD header and map each identifier (bytes) to its signal name"""
     
-    with open(vcd_file, 'r') as f:
-        in_header = True
-        
+    signals = {}
+    with open(vcd_file, 'rb') as f:
         for line in f:
             line = line.strip()
-            
-            # Parse variable definitions
-            if line.startswith('$var'):
+            if line.startswith(b'$var'):
                 parts = line.split()
                 if len(parts) >= 5:
-                    identifier = parts[3]
-                    signal_name = parts[4]
-                    signals[identifier] = signal_name
-            
-            # End of header
-            elif line.startswith('$enddefinitions'):
-                in_header = False
-            
-            # Parse time changes
-            elif line.startswith('#') and not in_header:
-                current_time = int(line[1:])
+                    signals[parts[3]] = parts[4].decode()
+            elif line.startswith(b'$enddefinitions'):
+                break
+    
+    return signals
+
+def _scan_changes(mm, start, end, signals, values, max_time=None):
+    """Append the value changes in mm[start:end] to values
+    
+    signals maps identifier (bytes) to (signal name, width). start must be
+    at the beginning of a line. Scanning stops at the first time past
+    max_time, if given. Returns the time of the last value change of any
+    signal in the range, or None if there is none.
+    """
+    
+    # Each identifier gets the bound append methods of its signal's arrays
+    # so the loop below does no name lookups
+    slots = {}
+    for id_, (name, width) in signals.items():
+        times, vals = values[name]
+        slots[id_] = (times.append, vals.append, width)
+    
+    # One shared str per distinct vector value; registers keep revisiting
+    # the same few values, so most changes store a reference, not a copy
+    interned = {}
+    
+    current_time = 0
+    end_time = None
+    
+    # One regex scan classifies every line; lastindex tells which
+    # alternative matched
+    get_signal = slots.get
+    for m in _CHANGE_RE.finditer(mm, start, end):
+        kind = m.lastindex
+        if kind == 3:
+            # Single bit value
+            end_time = current_time
+            signal = get_signal(m[3])
+            if signal is not None:
+                signal[0](current_time)
+                signal[1](_BIT_VALUES[m[2]])
+        elif kind == 5:
+            # Multi-bit value
+            end_time = current_time
+            signal = get_signal(m[5])
+            if signal is not None:
+                bits = m[4]
+                width = signal[2]
+                if len(bits) < width:
+                    # Left-extend short forms: 0/1 pad with 0, x/z with themselves
+                    fill = bits[:1] if bits[:1] in (b'x', b'z') else b'0'
+                    bits = fill * (width - len(bits)) + bits
+                value = interned.get(bits)
+                if value is None:
+                    value = interned[bits] = bits.decode()
+                signal[0](current_time)
+                signal[1](value)
+        else:
+            current_time = int(m[1])
+            if max_time is not None and current_time > max_time:
+                break
+    
+    return end_time
+
+def _parse_shard(args):
+    """Worker: parse one time-aligned byte range of a VCD file"""
+    vcd_file, start, end, signals = args
+    values = defaultdict(lambda: (array('q'), []))
+    with open(vcd_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end_time = _scan_changes(mm, start, end, signals, values)
+    return dict(values), end_time
+
+def _shard_bounds(mm, start, end, jobs):
+    """Split mm[start:end] into up to jobs ranges that each begin at a #time line"""
+    bounds = [start]
+    step = (end - start) // jobs
+    for k in range(1, jobs):
+        cut = mm.find(b'\n#', max(start + k * step, bounds[-1]), end)
+        if cut < 0:
+            break
+        bounds.append(cut + 1)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+def parse_vcd(vcd_file, wanted=None, jobs=None, max_time=None):
+    """Parse VCD file and extract signal data
+    
+    If wanted is given, only value changes of those identifiers (bytes) are
+    kept. Returns (values, end_time) where values maps each signal name to
+    parallel (times, values) sequences and end_time is the time of the last
+    value change of any signal.
+    
+    If max_time is given, parsing stops at the first time past it. Otherwise
+    bodies larger than _PARALLEL_MIN_BYTES are split at #time lines and
+    parsed in up to jobs worker processes (default: one per CPU).
+    """
+    
+    signals = {}  # Maps identifier (bytes) to (signal name, width)
+    values = defaultdict(lambda: (array('q'), []))  # Maps signal name to (times, values)
+    end_time = 0
+    
+    with open(vcd_file, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return values, end_time  # empty file
+    
+    with mm:
+        enddefs = _ENDDEFS_RE.search(mm)
+        if enddefs is None:
+            return values, end_time
+        
+        # Parse variable definitions
+        for m in _VAR_RE.finditer(mm, 0, enddefs.start()):
+            width, id_, name = m.groups()
+            if wanted is None or id_ in wanted:
+                name = name.decode()
+                signals[id_] = (name, int(width))
+                values[name]  # creates the entry, keeping definition order
+        
+        # The body starts on the line after $enddefinitions
+        body = mm.find(b'\n', enddefs.end()) + 1 or len(mm)
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        
+        if max_time is None and jobs > 1 and len(mm) - body >= _PARALLEL_MIN_BYTES:
+            shards = _shard_bounds(mm, body, len(mm), jobs)
+        else:
+            shards = [(body, len(mm))]
+        
+        if len(shards) == 1:
+            shard_end = _scan_changes(mm, body, len(mm), signals, values, max_time)
+            if shard_end is not None:
+                end_time = shard_end
+    
+    if len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            results = pool.map(_parse_shard, [(vcd_file, start, end, signals) for start, end in shards])
             
-            # Parse value changes
-            elif not in_header and line:
-                if line[0] in '01xz':
-                    # Single bit value
-                    value = line[0]
-                    identifier = line[1:]
-                    if identifier in signals:
-                        signal_name = signals[identifier]
-                        values[signal_name].append((current_time, value))
-                
-                elif line[0] == 'b':
-                    # Multi-bit value
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        value = parts[0][1:]  # Remove 'b' prefix
-                        identifier = parts[1]
-                        if identifier in signals:
-                            signal_name = signals[identifier]
-                            values[signal_name].append((current_time, value))
-    
-    return values
+            # Shards cover consecutive time ranges, so concatenating in
+            # order keeps every signal's changes sorted
+            for shard_values, shard_end in results:
+                for name, (times, vals) in shard_values.items():
+                    all_times, all_vals = values[name]
+                    all_times.extend(times)
+                    all_vals.extend(vals)
+                if shard_end is not None:
+                    end_time = shard_end
+    
+    # Signals that never changed are not reported
+    for name in [name for name, (times, _) in values.items() if not times]:
+        del values[name]
+    
+    return values, end_time
+
+def parse_vcd_cached(vcd_file, wanted=None, max_time=None):
+    """parse_vcd, reusing the result stored in a <vcd_file>.idx sidecar
+    
+    The sidecar is keyed on the VCD's mtime and size, the wanted identifiers,
+    max_time and this module's mtime, so any change to either triggers a
+    re-parse.
+    """
+    st = os.stat(vcd_file)
+    key = (st.st_mtime_ns, st.st_size, wanted, max_time, os.path.getmtime(__file__))
+    idx_file = vcd_file + '.idx'
+    try:
+        with open(idx_file, 'rb') as f:
+            cached_key, values, end_time = pickle.load(f)
+        if cached_key == key:
+            return values, end_time
+    except Exception:
+        pass  # missing, stale or unreadable: parse from scratch
+    
+    values, end_time = parse_vcd(vcd_file, wanted, max_time=max_time)
+    values = dict(values)
+    try:
+        with open(idx_file, 'wb') as f:
+            pickle.dump((key, values, end_time), f, pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass  # caching is best-effort
+    return values, end_time
+
+# str.translate table from single-bit value to waveform glyph, indexed by
+# code point; anything but 0 and 1 renders as '?'
+_GLYPH_TABLE = ['?'] * 256
+_GLYPH_TABLE[ord('0')] = '_'
+_GLYPH_TABLE[ord('1')] = '▄'
+
+# Zero padding strings for format_binary_value, by length
+_PAD_CACHE = {w: '0' * w for w in range(65)}
+
+@lru_cache(maxsize=4096)
+def _bin_to_int(value):
+    """Convert a binary string to an int, or None if it holds x/z bits"""
+    if value and not value.strip('01'):
+        return int(value, 2)
+    return None
+
+@lru_cache(maxsize=4096)
+def _display_value(value):
+    """Table text for a value: bits as-is, vectors in decimal, x/z truncated"""
+    if len(value) == 1 and value in '01':
+        return value
+    decimal = _bin_to_int(value)
+    if decimal is not None:
+        return str(decimal)
+    return value[:6]
 
 def format_binary_value(value, width=8):
     """Format binary value for display"""
-    if value in ['x', 'z']:
+    if value in ('x', 'z'):
         return value * width
     # Pad with zeros or truncate
-    return value.rjust(width, '0')[-width:]
+    missing = width - len(value)
+    if missing <= 0:
+        return value[-width:]
+    pad = _PAD_CACHE.get(missing)
+    if pad is None:
+        pad = '0' * missing
+    return pad + value
+
+def build_state_matrix(values, signal_names):
+    """Build the value every signal holds at each change time of any of them
+    
+    Returns (time_points, states) where time_points is the sorted union of
+    change times and states maps each signal name to a list of its values,
+    aligned with time_points. Signals start out as '0'.
+    """
+    # Change times are already sorted per signal (VCD time never goes
+    # backwards), so a k-way merge with adjacent duplicates dropped suffices
+    merged = heapq.merge(*(values[sig][0] for sig in signal_names if sig in values))
+    time_points = [t for t, _ in groupby(merged)]
+    
+    states = {}
+    for sig in signal_names:
+        times, vals = values[sig] if sig in values else ((), ())
+        column = []
+        i, n = 0, len(times)
+        current_val = '0'
+        for t in time_points:
+            while i < n and times[i] <= t:
+                current_val = vals[i]
+                i += 1
+            column.append(current_val)
+        states[sig] = column
+    
+    return time_points, states
+
+def render_waveform(times, vals, max_time, step=5):
+    """Render a single-bit signal sampled every step ns as a glyph string
+    
+    Each sample shows the value of the last change at or before it. Instead
+    of looking that up per sample, the change list is walked once and every
+    run between two changes is emitted as one repeated value; the whole
+    string is then mapped to glyphs with a single translate.
+    """
+    samples = max_time // step + 1
+    runs = []
+    done = 0  # samples already emitted
+    current_val = '0'
+    for t, v in zip(times, vals):
+        if t > max_time:
+            break
+        first = -(-t // step)  # first sample at or after t
+        if first > done:
+            runs.append((current_val if len(current_val) == 1 else '?') * (first - done))
+            done = first
+        current_val = v
+    runs.append((current_val if len(current_val) == 1 else '?') * (samples - done))
+    return ''.join(runs).translate(_GLYPH_TABLE)
 
 def print_ascii_waveform(values, signal_name, max_time):
     """Print ASCII waveform for a signal"""
     
-    if not values:
+    times, vals = values
+    if not times:
         return
     
-    # Create timeline
-    time_points = sorted(set(t for t, _ in values))
-    if not time_points:
-        return
+    # Lines are collected and written out in one go
+    out = []
     
     # For single-bit signals, create ASCII waveform
-    if all(v in '01xz' for _, v in values):
-        print(f"\n{signal_name}:")
+    if all(len(v) == 1 and v in '01xz' for v in vals):
+        out.append(f"\n{signal_name}:")
         
-        # Create waveform string
-        waveform = []
-        current_val = '0'
-        value_dict = dict(values)
-        
-        for t in range(0, max_time + 1, 5):  # Sample every 5ns
-            if t in value_dict:
-                current_val = value_dict[t]
-            
-            if current_val == '1':
-                waveform.append('▄')
-            elif current_val == '0':
-                waveform.append('_')
-            else:
-                waveform.append('?')
-        
-        print('  ' + ''.join(waveform))
+        out.append('  ' + render_waveform(times, vals, max_time))
         
         # Print time markers
         markers = []
         for t in range(0, max_time + 1, 25):
             markers.append(str(t).ljust(5))
-        print('  ' + ''.join(markers))
+        out.append('  ' + ''.join(markers))
     
     else:
         # Multi-bit signal - print value changes
-        print(f"\n{signal_name} (multi-bit):")
-        for time, value in values[:20]:  # Limit to first 20 changes
-            try:
-                decimal = int(value, 2) if value.replace('x', '').replace('z', '') else None
-                if decimal is not None:
-                    print(f"  {time:6d}ns: {value:>8s} (decimal: {decimal})")
-                else:
-                    print(f"  {time:6d}ns: {value:>8s}")
-            except:
-                print(f"  {time:6d}ns: {value:>8s}")
+        out.append(f"\n{signal_name} (multi-bit):")
+        for time, value in zip(times[:20], vals[:20]):  # Limit to first 20 changes
+            decimal = _bin_to_int(value)
+            if decimal is not None:
+                out.append(f"  {time:6d}ns: {value:>8s} (decimal: {decimal})")
+            else:
+                out.append(f"  {time:6d}ns: {value:>8s}")
+    
+    sys.stdout.write('\n'.join(out) + '\n')
 
-def print_table(values, signals_to_show, start_time=0, end_time=None):
-    """Print values in a table format"""
+def print_table(values, signals_to_show, start_time=0, end_time=None, matrix=None):
+    """Print values in a table format
     
-    # Get all unique time points
-    all_times = set()
-    for signal in signals_to_show:
-        if signal in values:
-            all_times.update(t for t, _ in values[signal])
+    matrix is the (time_points, states) pair from build_state_matrix; it is
+    built from values when not given.
+    """
     
-    time_points = sorted(all_times)
+    if matrix is None:
+        matrix = build_state_matrix(values, signals_to_show)
+    all_time_points, states = matrix
     
     if end_time:
-        time_points = [t for t in time_points if start_time <= t <= end_time]
+        rows = [i for i, t in enumerate(all_time_points) if start_time <= t <= end_time]
     else:
-        time_points = [t for t in time_points if t >= start_time]
+        rows = [i for i, t in enumerate(all_time_points) if t >= start_time]
     
-    if not time_points:
+    if not rows:
         print("No data in specified time range")
         return
     
-    # Print header
-    print("\n" + "="*80)
-    print("SIGNAL VALUES TABLE")
-    print("="*80)
+    # Print header; rows are collected and written out in one go
+    out = ["\n" + "="*80, "SIGNAL VALUES TABLE", "="*80]
     header = f"{'Time(ns)':>10} | " + " | ".join(f"{sig:>10}" for sig in signals_to_show)
-    print(header)
-    print("-"*80)
-    
-    # Get current value for each signal at each time
-    signal_values = {sig: dict(values[sig]) if sig in values else {} for sig in signals_to_show}
-    current_values = {sig: '0' for sig in signals_to_show}
+    out.append(header)
+    out.append("-"*80)
     
-    for time in time_points[:50]:  # Limit to first 50 time points
-        row = f"{time:>10} | "
+    for i in rows[:50]:  # Limit to first 50 time points
+        row = f"{all_time_points[i]:>10} | "
         
         for signal in signals_to_show:
-            if time in signal_values[signal]:
-                current_values[signal] = signal_values[signal][time]
-            
-            val = current_values[signal]
-            
-            # Try to convert to decimal for display
-            try:
-                if val in '01':
-                    display_val = val
-                else:
-                    decimal = int(val, 2) if val.replace('x', '').replace('z', '') else None
-                    if decimal is not None:
-                        display_val = str(decimal)
-                    else:
-                        display_val = val[:6]
-            except:
-                display_val = val[:6]
-            
-            row += f"{display_val:>10} | "
+            row += f"{_display_value(states[signal][i]):>10} | "
         
-        print(row.rstrip(' |'))
+        out.append(row.rstrip(' |'))
+    
+    if len(rows) > 50:
+        out.append(f"\n... ({len(rows) - 50} more time points) ...")
     
-    if len(time_points) > 50:
-        print(f"\n... ({len(time_points) - 50} more time points) ...")
+    sys.stdout.write('\n'.join(out) + '\n')
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 vcd_viewer.py <vcd_file>")
+    args = sys.argv[1:]
+    
+    # -t/--max-time N: only parse up to time N (at least the 200 the
+    # waveforms show), for a quick look at long simulations
+    time_limit = None
+    for flag in ('-t', '--max-time'):
+        if flag in args:
+            i = args.index(flag)
+            try:
+                time_limit = max(int(args[i + 1]), 200)
+            except (IndexError, ValueError):
+                args = []
+                break
+            del args[i:i + 2]
+    
+    if not args:
+        print("Usage: python3 vcd_viewer.py [-t|--max-time N] <vcd_file>")
         print("\nExample: python3 vcd_viewer.py cpu_sim.vcd")
         sys.exit(1)
     
-    vcd_file = sys.argv[1]
+    vcd_file = args[0]
     
     print("="*80)
     print("VCD WAVEFORM VIEWER")
     print("="*80)
     print(f"Reading: {vcd_file}\n")
     
-    try:
-        values = parse_vcd(vcd_file)
-    except FileNotFoundError:
-        print(f"ERROR: File '{vcd_file}' not found!")
-        sys.exit(1)
-    except Exception as e:
-        print(f"ERROR: Failed to parse VCD file: {e}")
-        sys.exit(1)
-    
-    if not values:
-        print("No signals found in VCD file!")
-        sys.exit(1)
-    
-    # Determine max time
-    max_time = 0
-    for signal_values in values.values():
-        if signal_values:
-            max_time = max(max_time, max(t for t, _ in signal_values))
-    
-    print(f"Simulation time: 0 to {max_time} ns")
-    print(f"Signals found: {len(values)}\n")
-    
     # Key signals to display
     important_signals = [
         'clk',
@@ -227,32 +431,58 @@ def main():
         'reg3_out',
         'instruction'
     ]
+    single_bit_signals = ['clk', 'rst', 'halt']
     
-    # Filter to signals that exist
-    signals_to_show = [sig for sig in important_signals if any(sig in name for name in values.keys())]
+    try:
+        # Read the header first so only the signals shown below get parsed
+        signals = read_vcd_header(vcd_file)
+        wanted_leaves = dict.fromkeys(important_signals + single_bit_signals)
+        leaf_re = re.compile(r'(?:^|\.)(' + '|'.join(map(re.escape, wanted_leaves)) + r')$')
+        wanted_ids = frozenset(id_ for id_, name in signals.items() if leaf_re.search(name))
+        values, max_time = parse_vcd_cached(vcd_file, wanted_ids, time_limit)
+    except FileNotFoundError:
+        print(f"ERROR: File '{vcd_file}' not found!")
+        sys.exit(1)
+    except Exception as e:
+        print(f"ERROR: Failed to parse VCD file: {e}")
+        sys.exit(1)
     
-    # Find actual signal names (they might have hierarchy prefix)
-    actual_signals = []
-    for desired_sig in important_signals:
-        for actual_sig in values.keys():
-            if actual_sig.endswith(desired_sig):
-                actual_signals.append(actual_sig)
-                break
+    if not signals:
+        print("No signals found in VCD file!")
+        sys.exit(1)
+    
+    if time_limit is None:
+        print(f"Simulation time: 0 to {max_time} ns")
+    else:
+        # Only the start of the trace was read, so the real end is unknown
+        print(f"Simulation time: 0 to {max_time} ns (parsed up to {time_limit})")
+    print(f"Signals found: {len(set(signals.values()))}\n")
+    
+    # Find actual signal names (they might have hierarchy prefix) in one
+    # pass; the first signal seen with a given leaf name wins
+    leaf_index = {}
+    for full_name in values:
+        m = leaf_re.search(full_name)
+        if m:
+            leaf_index.setdefault(m[1], full_name)
+    
+    actual_signals = [leaf_index[sig] for sig in important_signals if sig in leaf_index]
+    
+    # Value of every displayed signal at each change time, built once
+    matrix = build_state_matrix(values, actual_signals)
     
     if actual_signals:
-        print_table(values, actual_signals)
+        print_table(values, actual_signals, matrix=matrix)
     
     # Print ASCII waveforms for single-bit signals
     print("\n" + "="*80)
     print("ASCII WAVEFORMS (Single-bit signals)")
     print("="*80)
     
-    single_bit_signals = ['clk', 'rst', 'halt']
     for desired_sig in single_bit_signals:
-        for actual_sig in values.keys():
-            if actual_sig.endswith(desired_sig):
-                print_ascii_waveform(values[actual_sig], actual_sig, min(max_time, 200))
-                break
+        actual_sig = leaf_index.get(desired_sig)
+        if actual_sig is not None:
+            print_ascii_waveform(values[actual_sig], actual_sig, min(max_time, 200))
     
     # Print detailed register changes
     print("\n" + "="*80)
@@ -260,21 +490,26 @@ def main():
     print("="*80)
     
     reg_signals = ['reg0_out', 'reg1_out', 'reg2_out', 'reg3_out']
+    out = []
     for desired_reg in reg_signals:
-        for actual_sig in values.keys():
-            if actual_sig.endswith(desired_reg):
-                print(f"\n{actual_sig}:")
-                reg_values = values[actual_sig]
-                for time, value in reg_values[:15]:  # Show first 15 changes
-                    try:
-                        decimal = int(value, 2)
-                        print(f"  {time:6d}ns: {value:>4s} (decimal: {decimal:2d})")
-                    except:
-                        print(f"  {time:6d}ns: {value:>4s}")
-                
-                if len(reg_values) > 15:
-                    print(f"  ... ({len(reg_values) - 15} more changes)")
-                break
+        actual_sig = leaf_index.get(desired_reg)
+        if actual_sig is None:
+            continue
+        
+        out.append(f"\n{actual_sig}:")
+        reg_times, reg_values = values[actual_sig]
+        for time, value in zip(reg_times[:15], reg_values[:15]):  # Show first 15 changes
+            decimal = _bin_to_int(value)
+            if decimal is not None:
+                out.append(f"  {time:6d}ns: {value:>4s} (decimal: {decimal:2d})")
+            else:
+                out.append(f"  {time:6d}ns: {value:>4s}")
+        
+        if len(reg_values) > 15:
+            out.append(f"  ... ({len(reg_values) - 15} more changes)")
+    
+    if out:
+        sys.stdout.write('\n'.join(out) + '\n')
     
     print("\n" + "="*80)
     print("TIP: For better visualization, try the web viewer:")